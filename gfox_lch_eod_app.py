@@ -1,6 +1,8 @@
 import os
 import logging
 import psycopg2
+import psycopg2.extensions
+import psycopg2.pool
 import pandas as pd
 from datetime import datetime, timedelta
 import streamlit as st
@@ -9,10 +11,22 @@ import requests
 import re
 from urllib.parse import urljoin
 from bs4 import BeautifulSoup
-from collections import OrderedDict
+from collections import Counter, OrderedDict, deque
+from contextlib import contextmanager
 import csv
 import json
 import time
+import gzip
+import io
+import shutil
+import tempfile
+import uuid
+import zipfile
+import cProfile
+import pstats
+import sys
+import threading
+import tracemalloc
 
 # -------------------------- Global Variables --------------------------
 
@@ -22,9 +36,19 @@ DB_PARAMS = {
     "user": "gfox",
     "password": "gfox1234",
     "host": "10.16.1.10",
-    "port": "5432"
+    "port": "5432",
+    # TCP keepalives stop firewalls from silently dropping idle pooled connections
+    "keepalives": 1,
+    "keepalives_idle": 60,
+    "keepalives_interval": 10,
+    "keepalives_count": 5
 }
 
+# Connection pool size; each pooled connection keeps its own prepared statements
+DB_POOL_MIN_CONNECTIONS = 1
+DB_POOL_MAX_CONNECTIONS = 4
+DB_POOL_WAIT_SECONDS = 30  # How long a session waits for a free connection when all are in use
+
 # Directory paths
 GFOX_BASE_DIRECTORY = r"Z:\DUCO LCH Recon App\PROD\File Creation\API\GFOX EOD Files"
 LCH_BASE_DIRECTORY = r"Z:\DUCO LCH Recon App\PROD\File Creation\API\LCH EOD Files"
@@ -37,6 +61,8 @@ DUCO_API_HEADERS = {
     "Accept": "application/vnd.duco-cube.v3+json"
 }
 DUCO_PROCESSES_URL = "https://gfo-x.duco-app.com/processes"
+DUCO_UPLOAD_COMPRESSION = "none"  # Default upload body: "none", "gzip" (Content-Encoding) or "zip" (zipped file)
+DUCO_UPLOAD_COMPRESSION_OPTIONS = ("none", "gzip", "zip")
 
 # File patterns for submissions
 FILE_PATTERNS = {
@@ -53,6 +79,30 @@ FILE_PATTERNS = {
                     "LCH": r"INSTRUMENT_GFOX_PRD_\d{8}\.csv"}
 }
 
+# Trade queries that support incremental extraction. The last exported record_id
+# per query is kept in HIGH_WATER_MARK_FILENAME inside each date's GFOX folder
+INCREMENTAL_QUERY_TYPES = ("LCH_EOD_trades_ingest_long", "LCH_EOD_trades_ingest_short")
+HIGH_WATER_MARK_FILENAME = "trades_high_water_marks.json"
+INCREMENTAL_OVERLAP_RECORDS = 5000  # record_ids below the mark that are re-read to catch late commits
+
+# Query plan diagnostics: EXPLAIN output is stored per date, with one summary row
+# per query and run appended to the history file for comparison across days
+QUERY_PLAN_DIRECTORY = os.path.join(GFOX_BASE_DIRECTORY, "Query Plans")
+QUERY_PLAN_HISTORY_FILE = "query_plan_history.csv"
+QUERY_PLAN_REGRESSION_FACTOR = 1.5  # Flag runs slower than this multiple of the historical median
+
+# Run log settings: only the tail is kept in memory and shown in the UI,
+# the full history of every run is written to LOG_DIRECTORY
+LOG_DIRECTORY = "run_logs"
+LOG_TAIL_LINES = 500
+LOG_RENDER_INTERVAL = 0.25  # Minimum seconds between live UI refreshes
+
+# Profiling output (.prof for pstats/snakeviz, .collapsed for flamegraph.pl/speedscope)
+PROFILE_DIRECTORY = "profiles"
+PROFILE_SAMPLE_INTERVAL = 0.005  # Seconds between stack samples
+PROFILE_TOP_N = 15
+PROFILE_PEAK_SNAPSHOT_GROWTH = 1.25  # Re-snapshot allocations each time traced memory grows by this factor
+
 # -------------------------- Helper Functions --------------------------
 
 # Configure logging
@@ -62,14 +112,145 @@ logging.basicConfig(filename='query_log.txt', level=logging.INFO, format='%(asct
 def log_query(query):
     logging.info(query)
 
+class LogSink:
+    """Bounded run log: O(1) appends, tail rendered in the UI, full history spilled to disk."""
+
+    def __init__(self, name, placeholder=None, height=250, tail_lines=LOG_TAIL_LINES, min_level=logging.INFO):
+        self.placeholder = placeholder
+        self.height = height
+        self.min_level = min_level
+        self.lines = deque(maxlen=tail_lines)
+        self.written = 0
+        self.rendered = 0
+        self.last_render = 0.0
+
+        os.makedirs(LOG_DIRECTORY, exist_ok=True)
+        self.spill_path = os.path.join(LOG_DIRECTORY, f"{name}_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}.log")
+        self.spill_file = None
+
+    def write(self, message, level=logging.INFO):
+        # Every message goes to disk; only messages at or above min_level reach the UI tail
+        if self.spill_file is None:
+            self.spill_file = open(self.spill_path, 'a', encoding='utf-8')
+        self.spill_file.write(f"{datetime.now().isoformat(timespec='milliseconds')} {logging.getLevelName(level)} {message}\n")
+
+        if level >= self.min_level:
+            self.lines.append(message)
+            self.written += 1
+            if time.monotonic() - self.last_render >= LOG_RENDER_INTERVAL:
+                self.render()
+
+    def tail(self):
+        return "\n".join(self.lines) + "\n" if self.lines else ""
+
+    def render(self):
+        # Skip when nothing new has been logged, the widget already shows the current tail
+        if self.placeholder is None or self.rendered == self.written:
+            return
+        label = "Logs" if self.written <= len(self.lines) else f"Logs (last {len(self.lines)} lines, full log: {self.spill_path})"
+        self.placeholder.text_area(label, self.tail(), height=self.height, key=f"{self.spill_path}_{self.written}")
+        self.rendered = self.written
+        self.last_render = time.monotonic()
+
+    def flush(self):
+        """Render the final tail and close the spill file (reopened on the next write)."""
+        self.render()
+        if self.spill_file is not None:
+            self.spill_file.close()
+            self.spill_file = None
+
+# -------------------------- Database Helpers --------------------------
+
+# Matches the %(name)s parameters used by the queries in queries.yaml
+QUERY_PARAM_PATTERN = re.compile(r"%\((\w+)\)s")
+
+# Matches the trailing ORDER BY (and semicolon) of a query in queries.yaml
+TRAILING_ORDER_BY_PATTERN = re.compile(r"\s+ORDER\s+BY\s[^;()]*;?\s*$", re.IGNORECASE)
+
+class PreparedStatementConnection(psycopg2.extensions.connection):
+    """Connection that caches the server-side prepared statements created on it."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared_statements = {}
+
+# One pool per Streamlit server process, shared by every session and rerun
+@st.cache_resource
+def get_connection_pool():
+    return psycopg2.pool.ThreadedConnectionPool(
+        DB_POOL_MIN_CONNECTIONS,
+        DB_POOL_MAX_CONNECTIONS,
+        connection_factory=PreparedStatementConnection,
+        **DB_PARAMS
+    )
+
+# Borrow a live connection, waiting while every connection is in use and replacing
+# connections the server or network dropped while they sat idle in the pool
+def checkout_connection(pool):
+    deadline = time.monotonic() + DB_POOL_WAIT_SECONDS
+    stale_connections = 0
+    while True:
+        try:
+            conn = pool.getconn()
+        except psycopg2.pool.PoolError:
+            if pool.closed:
+                raise
+            if time.monotonic() >= deadline:
+                raise psycopg2.pool.PoolError(
+                    f"All {DB_POOL_MAX_CONNECTIONS} database connections are in use by other sessions. "
+                    f"Please try again shortly."
+                )
+            time.sleep(0.5)
+            continue
+
+        try:
+            # Autocommit keeps prepared statements and read-only queries out of long transactions
+            conn.autocommit = True
+            conn.cursor().execute("SELECT 1")
+            return conn
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            pool.putconn(conn, close=True)
+            stale_connections += 1
+            if stale_connections > DB_POOL_MAX_CONNECTIONS:
+                raise
+            logging.warning("Discarded a stale pooled database connection")
+
+# Borrow a connection from the pool, discarding it instead of returning it if it broke
+@contextmanager
+def pooled_connection():
+    pool = get_connection_pool()
+    conn = checkout_connection(pool)
+    broken = False
+    try:
+        yield conn
+    except (psycopg2.OperationalError, psycopg2.InterfaceError):
+        broken = True
+        raise
+    finally:
+        pool.putconn(conn, close=broken or bool(conn.closed))
+
+def execute_prepared(cur, query, params, prefix=""):
+    """Execute a %(name)s query as a prepared statement, preparing it once per connection."""
+    conn = cur.connection
+    statement = conn.prepared_statements.get(query)
+
+    if statement is None:
+        names = list(OrderedDict.fromkeys(QUERY_PARAM_PATTERN.findall(query)))
+        sql = QUERY_PARAM_PATTERN.sub(lambda match: f"${names.index(match.group(1)) + 1}", query)
+        name = f"gfox_stmt_{len(conn.prepared_statements) + 1}"
+        # Parameter types are inferred by the server from the columns they are compared with
+        cur.execute(f"PREPARE {name} AS {sql.strip().rstrip(';')}")
+        statement = conn.prepared_statements[query] = (name, names)
+
+    name, names = statement
+    args = f" ({', '.join(['%s'] * len(names))})" if names else ""
+    cur.execute(f"{prefix}EXECUTE {name}{args}", [params[param] for param in names])
+
 # Streamlit logger to update in the app interface
-def streamlit_logger(log_message, log_widget):
-    """Update the Streamlit log widget with new log messages."""
-    if log_widget:
-        current_logs = log_widget
-        current_logs += f"{log_message}\n"
-        return current_logs
-    return f"{log_message}\n"
+def streamlit_logger(log_message, log_widget, level=logging.INFO):
+    """Append a message to the run's LogSink and return the sink."""
+    log_widget.write(log_message, level)
+    return log_widget
 
 # -------------------------- App 1: GFOX EOD File Extraction --------------------------
 
@@ -87,8 +268,8 @@ def gfox_eod_file_extraction():
     # Function to check database connection and provide feedback to the user
     def check_db_connection():
         try:
-            conn = psycopg2.connect(**DB_PARAMS)
-            conn.close()
+            with pooled_connection() as conn:
+                conn.cursor().execute("SELECT 1")
             st.success(f"Successfully connected to the database at {DB_PARAMS['host']}:{DB_PARAMS['port']}")
             return True
         except Exception as e:
@@ -107,16 +288,119 @@ def gfox_eod_file_extraction():
             st.error("Please enter the date in the correct format (YYYY-MM-DD).")
             return False
 
-    # Function to execute query and export data to CSV
-    def export_data(query, filename, save_directory, log_widget):
-        try:
-            log_query(query)
-            conn = psycopg2.connect(**DB_PARAMS)
+    # Function to build the typed query parameters for a trade date
+    def build_query_params(trade_date):
+        if trade_date.weekday() == 4:
+            t_plus_1_date = trade_date + timedelta(days=3)
+        else:
+            t_plus_1_date = trade_date + timedelta(days=1)
+
+        return {
+            "trade_date": trade_date.date(),
+            "t_plus_1_datetime": f"{t_plus_1_date.strftime('%Y-%m-%d')} 00:00:00.000"
+        }
+
+    # Function to fill in the structural parts of a query template; values are passed as parameters
+    def render_query(query_type, incremental=False):
+        record_id_filter = "AND record_id > %(after_record_id)s" if incremental else ""
+        return queries[query_type].format(record_id_filter=record_id_filter)
+
+    # Function to wrap a query so it only returns how many rows it matches. The ORDER BY is
+    # dropped, Postgres would otherwise sort every matching row of the day just to count them
+    def render_count_query(query_type):
+        query = TRAILING_ORDER_BY_PATTERN.sub("", render_query(query_type)).strip().rstrip(';')
+        return f"SELECT COUNT(*) FROM ({query}) AS matching_rows"
+
+    # Function to execute a query and return the result as a DataFrame
+    def run_query(query, params):
+        log_query(f"{query}\nParameters: {params}")
+        with pooled_connection() as conn:
             cur = conn.cursor()
-            cur.execute(query)
+            execute_prepared(cur, query, params)
             data = cur.fetchall()
             columns = [desc[0] for desc in cur.description]
-            df = pd.DataFrame(data, columns=columns)
+            return pd.DataFrame(data, columns=columns)
+
+    # Function to fetch the incremental rows and the full-day row count from one snapshot,
+    # so trades committed between the two statements cannot make them disagree
+    def run_incremental_query(query_type, params):
+        query = render_query(query_type, incremental=True)
+        log_query(f"{query}\nParameters: {params}")
+        with pooled_connection() as conn:
+            cur = conn.cursor()
+            cur.execute("BEGIN ISOLATION LEVEL REPEATABLE READ READ ONLY")
+            try:
+                execute_prepared(cur, query, params)
+                data = cur.fetchall()
+                columns = [desc[0] for desc in cur.description]
+                execute_prepared(cur, render_count_query(query_type), params)
+                total_rows = cur.fetchone()[0]
+                cur.execute("COMMIT")
+            except Exception:
+                if not conn.closed:
+                    cur.execute("ROLLBACK")
+                    # Do not rely on statements prepared inside the failed transaction
+                    cur.execute("DEALLOCATE ALL")
+                    conn.prepared_statements.clear()
+                raise
+            return pd.DataFrame(data, columns=columns), total_rows
+
+    # Functions to read and atomically write the trades high-water marks for a date folder
+    def load_high_water_marks(save_directory):
+        path = os.path.join(save_directory, HIGH_WATER_MARK_FILENAME)
+        if not os.path.exists(path):
+            return {}
+        with open(path, 'r') as file:
+            return json.load(file)
+
+    def save_high_water_marks(save_directory, marks):
+        path = os.path.join(save_directory, HIGH_WATER_MARK_FILENAME)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as file:
+            json.dump(marks, file, indent=2)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, path)
+
+    def clear_high_water_mark(query_type, save_directory):
+        marks = load_high_water_marks(save_directory)
+        if marks.pop(query_type, None) is not None:
+            save_high_water_marks(save_directory, marks)
+
+    # Function to record the newest exported row of a trades file, together with the
+    # file size at that point so an interrupted append can be rolled back. The record_ids
+    # inside the overlap window are kept so re-read rows can be de-duplicated
+    def record_high_water_mark(query_type, df, filename, save_path, save_directory, previous=None):
+        previous = previous or {}
+        marks = load_high_water_marks(save_directory)
+        record_ids = set(previous.get('recent_record_ids', [])) | {int(record_id) for record_id in df['record_id']}
+        if previous.get('record_id') is not None:
+            record_ids.add(previous['record_id'])
+        record_id = max(record_ids, default=None)
+
+        if df.empty:
+            transact_time = previous.get('transact_time')
+        else:
+            transact_time = max(str(df['transact_time'].max()), previous.get('transact_time') or "")
+
+        marks[query_type] = {
+            "filename": filename,
+            "record_id": record_id,
+            "transact_time": transact_time,
+            "recent_record_ids": sorted(
+                recent for recent in record_ids if recent > record_id - INCREMENTAL_OVERLAP_RECORDS
+            ),
+            "rows": previous.get('rows', 0) + len(df),
+            "size": os.path.getsize(save_path),
+            "updated_at": datetime.now().isoformat(timespec='seconds')
+        }
+        save_high_water_marks(save_directory, marks)
+
+    # Function to execute query and export data to CSV
+    def export_data(query, params, filename, save_directory, log_widget, query_type=None):
+        tmp_path = None
+        try:
+            df = run_query(query, params)
 
             # Ensure the save directory exists
             if not os.path.exists(save_directory):
@@ -130,18 +414,89 @@ def gfox_eod_file_extraction():
             else:
                 log_widget = streamlit_logger(f"  - Creating {filename}", log_widget)
 
-            df.to_csv(save_path, index=False)
+            # Drop the old mark first, a mark left over from the previous file would make the
+            # next incremental run truncate or append to the new one
+            if query_type in INCREMENTAL_QUERY_TYPES:
+                clear_high_water_mark(query_type, save_directory)
+
+            # Write to a temp file and swap it in so an interrupted export keeps the previous file.
+            # The leading dot keeps the temp file from matching the FILE_PATTERNS used for submission
+            tmp_path = os.path.join(save_directory, f".{filename}.tmp")
+            df.to_csv(tmp_path, index=False)
+            os.replace(tmp_path, save_path)
             logging.info(f"File saved: {save_path}")
-            conn.close()
+
+            # A full trades export resets the high-water mark for incremental refreshes
+            if query_type in INCREMENTAL_QUERY_TYPES:
+                record_high_water_mark(query_type, df, filename, save_path, save_directory)
 
         except Exception as e:
-            log_widget = streamlit_logger(f"Error: {str(e)}", log_widget)
+            log_widget = streamlit_logger(f"Error: {str(e)}", log_widget, logging.ERROR)
             logging.error(f"Error saving file: {str(e)}")
 
+            # Remove a partially written temp file
+            if tmp_path is not None and os.path.exists(tmp_path):
+                try:
+                    os.remove(tmp_path)
+                except OSError as remove_error:
+                    logging.error(f"Failed to remove {tmp_path}: {str(remove_error)}")
+
+        return log_widget
+
+    # Function to fetch only trades newer than the high-water mark and append them to the day's CSV
+    def export_trades_incremental(query_type, params, filename, save_directory, log_widget):
+        try:
+            save_path = os.path.join(save_directory, filename)
+            mark = load_high_water_marks(save_directory).get(query_type)
+
+            # Fall back to a full export when there is no usable mark for the file on disk
+            if (mark is None or mark.get('record_id') is None or mark.get('filename') != filename
+                    or not os.path.exists(save_path) or os.path.getsize(save_path) < mark['size']):
+                log_widget = streamlit_logger(f"  - No high-water mark for {filename}, running full extract", log_widget)
+                return export_data(render_query(query_type), params, filename, save_directory, log_widget, query_type)
+
+            # Roll back rows left behind by an append that was interrupted before its mark was saved
+            if os.path.getsize(save_path) > mark['size']:
+                with open(save_path, 'r+b') as file:
+                    file.truncate(mark['size'])
+                log_widget = streamlit_logger(f"  - Discarded incomplete append to {filename}", log_widget, logging.WARNING)
+
+            # Re-read a window below the mark: record_ids are assigned at insert, so a trade can
+            # commit after a higher record_id has already been exported
+            after_record_id = int(mark['record_id']) - INCREMENTAL_OVERLAP_RECORDS
+            df, total_rows = run_incremental_query(query_type, {**params, "after_record_id": after_record_id})
+            df = df[~df['record_id'].isin(mark.get('recent_record_ids', []))]
+
+            # Rows below the window, or rows that only started matching the filters later (for
+            # example once clearingtradeid is set), only show up as a row count difference
+            if mark['rows'] + len(df) != total_rows:
+                log_widget = streamlit_logger(
+                    f"  - {filename} has {mark['rows']} rows plus {len(df)} new, the database has {total_rows}, "
+                    f"running full extract", log_widget, logging.WARNING
+                )
+                return export_data(render_query(query_type), params, filename, save_directory, log_widget, query_type)
+
+            if df.empty:
+                log_widget = streamlit_logger(f"  - No new rows for {filename} after {mark['transact_time']}", log_widget)
+                return log_widget
+
+            with open(save_path, 'a', newline='', encoding='utf-8') as file:
+                df.to_csv(file, index=False, header=False)
+                file.flush()
+                os.fsync(file.fileno())
+            record_high_water_mark(query_type, df, filename, save_path, save_directory, previous=mark)
+
+            log_widget = streamlit_logger(f"  - Appended {len(df)} rows to {filename}", log_widget)
+            logging.info(f"Appended {len(df)} rows to: {save_path}")
+
+        except Exception as e:
+            log_widget = streamlit_logger(f"Error: {str(e)}", log_widget, logging.ERROR)
+            logging.error(f"Error appending to file: {str(e)}")
+
         return log_widget
 
     # Function to generate and export all queries
-    def generate_and_export_all(date_input, log_widget):
+    def generate_and_export_all(date_input, log_widget, incremental=False):
         try:
             trade_date = datetime.strptime(date_input, '%Y-%m-%d')
             trade_date_str = trade_date.strftime('%Y-%m-%d')
@@ -150,22 +505,11 @@ def gfox_eod_file_extraction():
             # Define the base save directory
             save_directory = os.path.join(GFOX_BASE_DIRECTORY, folder_date_str)
 
-            if trade_date.weekday() == 4:
-                t_plus_1_date = trade_date + timedelta(days=3)
-            else:
-                t_plus_1_date = trade_date + timedelta(days=1)
-
-            t_plus_1_date_str = t_plus_1_date.strftime('%Y-%m-%d')
+            params = build_query_params(trade_date)
 
             log_widget = streamlit_logger(f"\nExporting Files to: {save_directory}\n", log_widget)
 
-            for query_type, query_template in queries.items():
-                # Handle instrument queries that use both trade_date_str and t_plus_1_date_str
-                if query_type == "LCH_EOD_instruments_ingest":
-                    query = query_template.format(trade_date_str=trade_date_str, t_plus_1_date_str=t_plus_1_date_str)
-                else:
-                    query = query_template.format(trade_date_str=trade_date_str)
-
+            for query_type in queries:
                 # Define the custom filenames based on query_type
                 if query_type == "LCH_EOD_instruments_ingest":
                     filename = f"LCH EOD Instruments Ingest_{trade_date_str}.csv"
@@ -178,22 +522,128 @@ def gfox_eod_file_extraction():
                 else:
                     filename = f"{query_type}_{trade_date_str}.csv"  # Fallback for any other queries
 
-                log_widget = export_data(query, filename, save_directory, log_widget)
+                if incremental and query_type in INCREMENTAL_QUERY_TYPES:
+                    log_widget = export_trades_incremental(query_type, params, filename, save_directory, log_widget)
+                else:
+                    log_widget = export_data(render_query(query_type), params, filename, save_directory, log_widget, query_type)
 
             log_widget = streamlit_logger("\nAll queries exported successfully.\n", log_widget)
 
         except Exception as e:
-            log_widget = streamlit_logger(f"Failed to export all queries: {e}", log_widget)
+            log_widget = streamlit_logger(f"Failed to export all queries: {e}", log_widget, logging.ERROR)
             logging.error(f"Failed to export all queries: {e}")
 
         return log_widget
 
+    # Function to run EXPLAIN (ANALYZE, BUFFERS) for the prepared query and return the JSON plan
+    def explain_query(query, params):
+        log_query(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {query}\nParameters: {params}")
+        with pooled_connection() as conn:
+            cur = conn.cursor()
+            execute_prepared(cur, query, params, prefix="EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) ")
+            return cur.fetchone()[0][0]
+
+    # Function to walk a plan tree and collect sequential scans and sorts that spilled to disk
+    def summarise_plan(plan):
+        seq_scans = []
+        disk_sorts = []
+
+        def walk(node):
+            if node['Node Type'] == 'Seq Scan':
+                seq_scans.append(f"{node.get('Relation Name')} ({node.get('Actual Rows', 0)} rows)")
+            if 'Sort' in node['Node Type'] and node.get('Sort Space Type') == 'Disk':
+                disk_sorts.append(f"{node.get('Sort Method')} {node.get('Sort Space Used', 0)} kB")
+            for child in node.get('Plans', []):
+                walk(child)
+
+        walk(plan['Plan'])
+        return {
+            "planning_ms": round(plan.get('Planning Time', 0), 2),
+            "execution_ms": round(plan.get('Execution Time', 0), 2),
+            "rows": plan['Plan'].get('Actual Rows', 0),
+            "shared_hit_blocks": plan['Plan'].get('Shared Hit Blocks', 0),
+            "shared_read_blocks": plan['Plan'].get('Shared Read Blocks', 0),
+            "temp_written_blocks": plan['Plan'].get('Temp Written Blocks', 0),
+            "seq_scans": "; ".join(seq_scans),
+            "disk_sorts": "; ".join(disk_sorts)
+        }
+
+    # Function to compare a run against earlier runs of the same query and list what to look at
+    def flag_plan(summary, previous_runs):
+        flags = []
+        if summary['seq_scans']:
+            flags.append("Sequential scan")
+        if summary['disk_sorts']:
+            flags.append("Sort spilled to disk")
+        if not previous_runs.empty:
+            median_ms = previous_runs['execution_ms'].median()
+            if median_ms > 0 and summary['execution_ms'] > median_ms * QUERY_PLAN_REGRESSION_FACTOR:
+                flags.append(f"Slower than median ({median_ms:.0f} ms)")
+            last_seq_scans = previous_runs.iloc[-1]['seq_scans']
+            if summary['seq_scans'] and (pd.isna(last_seq_scans) or not last_seq_scans):
+                flags.append("New sequential scan")
+        return ", ".join(flags)
+
+    # Function to explain every query for a date, store the plans and show the results
+    def run_query_plan_diagnostics(date_input):
+        trade_date = datetime.strptime(date_input, '%Y-%m-%d')
+        trade_date_str = trade_date.strftime('%Y-%m-%d')
+        run_at = datetime.now()
+        params = build_query_params(trade_date)
+
+        plan_directory = os.path.join(QUERY_PLAN_DIRECTORY, trade_date.strftime('%Y%m%d'))
+        os.makedirs(plan_directory, exist_ok=True)
+        history_path = os.path.join(QUERY_PLAN_DIRECTORY, QUERY_PLAN_HISTORY_FILE)
+        history = pd.read_csv(history_path) if os.path.exists(history_path) else pd.DataFrame()
+
+        results = []
+        for query_type in queries:
+            try:
+                plan = explain_query(render_query(query_type), params)
+            except Exception as e:
+                st.error(f"Failed to explain {query_type}: {str(e)}")
+                logging.error(f"Failed to explain {query_type}: {str(e)}")
+                continue
+
+            plan_path = os.path.join(plan_directory, f"{query_type}_{run_at.strftime('%Y%m%d_%H%M%S')}.json")
+            with open(plan_path, 'w') as file:
+                json.dump(plan, file, indent=2)
+
+            summary = summarise_plan(plan)
+            previous_runs = history[history['query_type'] == query_type] if not history.empty else history
+            results.append({
+                "run_at": run_at.isoformat(timespec='seconds'),
+                "trade_date": trade_date_str,
+                "query_type": query_type,
+                **summary,
+                "flags": flag_plan(summary, previous_runs),
+                "plan_file": plan_path
+            })
+
+            with st.expander(f"{query_type}: {summary['execution_ms']} ms"):
+                st.json(plan, expanded=False)
+
+        if not results:
+            return
+
+        results_df = pd.DataFrame(results)
+        results_df.to_csv(history_path, mode='a', header=not os.path.exists(history_path), index=False)
+        st.dataframe(results_df.drop(columns=['run_at', 'plan_file']), hide_index=True)
+
+        for result in results:
+            if result['flags']:
+                st.warning(f"{result['query_type']}: {result['flags']}")
+
+        # Execution time per query across all diagnostic runs
+        history = pd.concat([history, results_df], ignore_index=True)
+        st.line_chart(history.pivot_table(index='run_at', columns='query_type', values='execution_ms'))
+
     # Create a text input for the date with validation for format and future dates
     date_input = st.text_input('Enter Today\'s Date (YYYY-MM-DD):', label_visibility='visible', max_chars=10)
 
     # Text area for log display
     log_widget = st.empty()
-    log_text = ""
+    log_text = LogSink("gfox_eod_file_extraction", log_widget, height=250)
 
     # Prevent the user from interacting with buttons before entering a valid date
     if not date_input:
@@ -210,44 +660,54 @@ def gfox_eod_file_extraction():
     trade_date = datetime.strptime(date_input, '%Y-%m-%d')
     folder_date_str = trade_date.strftime('%Y%m%d')
     save_directory = os.path.join(GFOX_BASE_DIRECTORY, folder_date_str)
+    params = build_query_params(trade_date)
+
+    # Incremental mode only fetches trades newer than the last export for this date
+    incremental = st.checkbox('Incremental trades extraction (append only new trades since the last export)')
 
     # Add GFOX EOD File Extraction Button
     if st.button('GFOX EOD File Extraction'):
-        log_text = generate_and_export_all(date_input, log_text)
-        log_widget.text_area("Logs", log_text, height=250)
+        log_text = generate_and_export_all(date_input, log_text, incremental)
+        log_text.flush()
 
     # Additional buttons for individual file extraction
     if st.button('Extract GFOX Trades Long Only'):
         log_text = streamlit_logger(f"Extracting GFOX Trades for {date_input}", log_text)
-        query = queries['LCH_EOD_trades_ingest_long'].format(trade_date_str=date_input)
-        log_text = export_data(query, f"LCH EOD Trades Ingest Long_{date_input}.csv", save_directory, log_text)
-        log_widget.text_area("Logs", log_text, height=250)
+        filename = f"LCH EOD Trades Ingest Long_{date_input}.csv"
+        if incremental:
+            log_text = export_trades_incremental('LCH_EOD_trades_ingest_long', params, filename, save_directory, log_text)
+        else:
+            query = render_query('LCH_EOD_trades_ingest_long')
+            log_text = export_data(query, params, filename, save_directory, log_text, 'LCH_EOD_trades_ingest_long')
+        log_text.flush()
 
     if st.button('Extract GFOX Trades Short Only'):
         log_text = streamlit_logger(f"Extracting GFOX Trades for {date_input}", log_text)
-        query = queries['LCH_EOD_trades_ingest_short'].format(trade_date_str=date_input)
-        log_text = export_data(query, f"LCH EOD Trades Ingest Short_{date_input}.csv", save_directory, log_text)
-        log_widget.text_area("Logs", log_text, height=250)
+        filename = f"LCH EOD Trades Ingest Short_{date_input}.csv"
+        if incremental:
+            log_text = export_trades_incremental('LCH_EOD_trades_ingest_short', params, filename, save_directory, log_text)
+        else:
+            query = render_query('LCH_EOD_trades_ingest_short')
+            log_text = export_data(query, params, filename, save_directory, log_text, 'LCH_EOD_trades_ingest_short')
+        log_text.flush()
 
     if st.button('Extract GFOX Prices Only'):
         log_text = streamlit_logger(f"Extracting GFOX Prices for {date_input}", log_text)
-        query = queries['LCH_EOD_prices_ingest'].format(trade_date_str=date_input)
-        log_text = export_data(query, f"LCH EOD Prices Ingest_{date_input}.csv", save_directory, log_text)
-        log_widget.text_area("Logs", log_text, height=250)
+        query = render_query('LCH_EOD_prices_ingest')
+        log_text = export_data(query, params, f"LCH EOD Prices Ingest_{date_input}.csv", save_directory, log_text)
+        log_text.flush()
 
-    # Fix: Add t_plus_1_date_str calculation here for instruments
+    # Instruments also use the T+1 parameter from build_query_params
     if st.button('Extract GFOX Instruments Only'):
         log_text = streamlit_logger(f"Extracting GFOX Instruments for {date_input}", log_text)
+        query = render_query('LCH_EOD_instruments_ingest')
+        log_text = export_data(query, params, f"LCH EOD Instruments Ingest_{date_input}.csv", save_directory, log_text)
+        log_text.flush()
 
-        if trade_date.weekday() == 4:
-            t_plus_1_date = trade_date + timedelta(days=3)
-        else:
-            t_plus_1_date = trade_date + timedelta(days=1)
-        t_plus_1_date_str = t_plus_1_date.strftime('%Y-%m-%d')
-
-        query = queries['LCH_EOD_instruments_ingest'].format(trade_date_str=date_input, t_plus_1_date_str=t_plus_1_date_str)
-        log_text = export_data(query, f"LCH EOD Instruments Ingest_{date_input}.csv", save_directory, log_text)
-        log_widget.text_area("Logs", log_text, height=250)
+    # Query plan diagnostics (EXPLAIN ANALYZE executes each query once)
+    st.subheader("Query Diagnostics")
+    if st.button('Run Query Plan Diagnostics'):
+        run_query_plan_diagnostics(date_input)
 
 # -------------------------- App 2: LCH EOD File Extraction --------------------------
 
@@ -343,16 +803,16 @@ def lch_eod_file_extraction():
             return
 
         # Function to log messages with clear sections
-        def log_message(message, log_text):
-            log_text += f"{message}\n"
+        def log_message(message, log_text, level=logging.INFO):
+            log_text.write(message, level)
             return log_text
 
         # Function to update the log widget
-        def update_log_widget(log_text, log_widget):
-            log_widget.text_area("Logs", log_text, height=600)
+        def update_log_widget(log_text):
+            log_text.flush()
 
         # Function to process individual files and handle logs
-        def process_individual_files(file_type, date_input, url, download_directory, log_text, log_widget):
+        def process_individual_files(file_type, date_input, url, download_directory, log_text):
             log_text = log_message(f"Starting {file_type} extraction for {date_input}...", log_text)
             files_info, log_text = list_files_in_directory(url, log_text)
 
@@ -373,11 +833,11 @@ def lch_eod_file_extraction():
                     log_text = log_message(f"No {file_type.lower()} files available for {date_input}.", log_text)
 
             # Update the log widget with the updated text
-            update_log_widget(log_text, log_widget)
+            update_log_widget(log_text)
 
         # Text area for log display
         log_widget = st.empty()
-        log_text = ""
+        log_text = LogSink("lch_eod_file_extraction", log_widget, height=600)
 
         # Function to list files from the directory
         def list_files_in_directory(url, log_widget):
@@ -385,7 +845,7 @@ def lch_eod_file_extraction():
             response = requests.get(url)
 
             if response.status_code != 200:
-                log_widget = streamlit_logger(f"Failed to access {url}. Status code: {response.status_code}", log_widget)
+                log_widget = streamlit_logger(f"Failed to access {url}. Status code: {response.status_code}", log_widget, logging.ERROR)
                 return {"error": f"Failed to access {url}. Status code: {response.status_code}"}, log_widget
 
             soup = BeautifulSoup(response.text, 'html.parser')
@@ -440,9 +900,16 @@ def lch_eod_file_extraction():
 
             return data
 
+        # Function to open a downloaded file for parsing, from the in-memory copy when the download kept one.
+        # BytesIO shares the bytes object's buffer, so the parser reads it without copying it again
+        def open_payload(file_path, payload=None):
+            if payload is None:
+                return open(file_path, 'r')
+            return io.TextIOWrapper(io.BytesIO(payload))
+
         # Function to process trade file
-        def process_trade_file(input_file, output_file_long, output_file_short, log_widget):
-            with open(input_file, 'r') as file:
+        def process_trade_file(input_file, output_file_long, output_file_short, log_widget, payload=None):
+            with open_payload(input_file, payload) as file:
                 lines = file.readlines()
 
             records = []
@@ -500,10 +967,10 @@ def lch_eod_file_extraction():
             return log_widget
 
         # Price-specific parsing logic
-        def parse_fix_messages(file_path):
+        def parse_fix_messages(file_path, payload=None):
             parsed_messages = []
 
-            with open(file_path, 'r') as file:
+            with open_payload(file_path, payload) as file:
                 for line in file:
                     message = line.strip().split('')
                     message_dict = OrderedDict()
@@ -541,15 +1008,15 @@ def lch_eod_file_extraction():
                     writer.writerow(message)
 
         # Function to parse price file
-        def parse_price_file(file_path, output_file, log_widget):
+        def parse_price_file(file_path, output_file, log_widget, payload=None):
             try:
                 log_widget = streamlit_logger(f"Processing Price File: {os.path.basename(file_path)}", log_widget)
-                parsed_messages = parse_fix_messages(file_path)
+                parsed_messages = parse_fix_messages(file_path, payload)
                 save_to_csv(parsed_messages, output_file)
                 log_widget = streamlit_logger(f"  - Created: {os.path.basename(output_file)}", log_widget)
 
             except Exception as e:
-                log_widget = streamlit_logger(f"Error processing price file: {str(e)}", log_widget)
+                log_widget = streamlit_logger(f"Error processing price file: {str(e)}", log_widget, logging.ERROR)
 
             return log_widget
 
@@ -569,19 +1036,34 @@ def lch_eod_file_extraction():
                 file_url = urljoin(base_url, file['name'])
                 local_file_path = os.path.join(download_directory, file['name'])
 
-                # Download the file
+                # Download the file. requests asks for gzip/deflate and iter_content decompresses while streaming.
+                # Files that get parsed are also teed into memory so the parser does not re-read them from disk
+                start_time = time.monotonic()
+                file_size = 0
+                chunks = [] if file['type'] in ('TRADES', 'PRICE') else None
                 with requests.get(file_url, stream=True) as r:
                     with open(local_file_path, 'wb') as f:
                         for chunk in r.iter_content(chunk_size=8192):
                             f.write(chunk)
+                            file_size += len(chunk)
+                            if chunks is not None:
+                                chunks.append(chunk)
+                    content_encoding = r.headers.get('Content-Encoding', 'identity')
+                    transferred = r.raw.tell()
+
+                log_widget = log_message(
+                    f"Downloaded {file['name']}: {transferred} bytes transferred ({content_encoding}), "
+                    f"{file_size} bytes written in {time.monotonic() - start_time:.2f}s", log_widget
+                )
 
+                payload = b"".join(chunks) if chunks is not None else None
                 original_files.append(file['name'])
                 all_files.append(local_file_path)
 
                 if file['type'] == 'TRADES':
                     output_file_long = os.path.join(download_directory, file['name'].replace(".dat", "_LONG_DUCO.csv"))
                     output_file_short = os.path.join(download_directory, file['name'].replace(".dat", "_SHORT_DUCO.csv"))
-                    log_widget = process_trade_file(local_file_path, output_file_long, output_file_short, log_widget)
+                    log_widget = process_trade_file(local_file_path, output_file_long, output_file_short, log_widget, payload)
                     parsed_files.append(os.path.basename(output_file_long))
                     parsed_files.append(os.path.basename(output_file_short))
                     all_files.append(output_file_long)
@@ -591,7 +1073,7 @@ def lch_eod_file_extraction():
 
                 elif file['type'] == 'PRICE':
                     output_file = os.path.join(download_directory, file['name'].replace(".csv", "_DUCO.csv"))
-                    log_widget = parse_price_file(local_file_path, output_file, log_widget)
+                    log_widget = parse_price_file(local_file_path, output_file, log_widget, payload)
                     parsed_files.append(os.path.basename(output_file))
                     all_files.append(output_file)
                     lch_eod_files.append(os.path.basename(output_file))
@@ -636,27 +1118,27 @@ def lch_eod_file_extraction():
                         log_text = log_message(f"  - {file}", log_text)
 
                 # Update log display with larger text area
-                log_widget.text_area("Logs", log_text, height=600)
+                update_log_widget(log_text)
 
             except Exception as e:
                 st.error(f"Error occurred: {str(e)}")
-                log_text = log_message(f"Error occurred: {str(e)}", log_text)
-                log_widget.text_area("Logs", log_text, height=600)
+                log_text = log_message(f"Error occurred: {str(e)}", log_text, logging.ERROR)
+                update_log_widget(log_text)
 
         # Group individual file extraction buttons under a subheader
         st.subheader("Individual LCH File Extractions")
         
         # Process trades only
         if st.button('Extract LCH Trades Only'):
-            process_individual_files("TRADES", date_input, url, download_directory, log_text, log_widget)
+            process_individual_files("TRADES", date_input, url, download_directory, log_text)
 
         # Process prices only
         if st.button('Extract LCH Prices Only'):
-            process_individual_files("PRICE", date_input, url, download_directory, log_text, log_widget)
+            process_individual_files("PRICE", date_input, url, download_directory, log_text)
 
         # Process instruments only
         if st.button('Extract LCH Instruments Only'):
-            process_individual_files("INSTRUMENTS", date_input, url, download_directory, log_text, log_widget)
+            process_individual_files("INSTRUMENTS", date_input, url, download_directory, log_text)
 
 # -------------------------- App 3: File Submission to DUCO --------------------------
 
@@ -701,6 +1183,13 @@ def file_submission_to_duco():
         st.error("Please enter a date to proceed.")
         return
 
+    # Only pick gzip or zip if the DUCO endpoint accepts that upload format
+    compression = st.selectbox(
+        'Upload compression:',
+        DUCO_UPLOAD_COMPRESSION_OPTIONS,
+        index=DUCO_UPLOAD_COMPRESSION_OPTIONS.index(DUCO_UPLOAD_COMPRESSION)
+    )
+
     def find_file(directory, pattern, status_container):
         status_container.update(label=f"Searching for files in {directory}...", state="running")
         for filename in os.listdir(directory):
@@ -710,12 +1199,66 @@ def file_submission_to_duco():
         status_container.update(label="No file found", state="error")
         return None
 
+    # Function to write a compressed multipart upload body to a temp file. The CSV is compressed in
+    # chunks as it is read, and the body is streamed from the temp file, so neither is held in memory.
+    # gzip compresses the whole body (sent with Content-Encoding), zip wraps the CSV in <name>.zip
+    def build_compressed_upload(file_path, compression):
+        boundary = uuid.uuid4().hex
+        file_name = os.path.basename(file_path)
+        part_name, part_type = (f"{file_name}.zip", "application/zip") if compression == "zip" else (file_name, "text/csv")
+
+        body = tempfile.TemporaryFile()
+        stream = gzip.GzipFile(fileobj=body, mode='wb', compresslevel=6) if compression == "gzip" else body
+        stream.write((
+            f"--{boundary}\r\n"
+            f'Content-Disposition: form-data; name="file"; filename="{part_name}"\r\n'
+            f"Content-Type: {part_type}\r\n\r\n"
+        ).encode())
+
+        with open(file_path, 'rb') as file:
+            if compression == "zip":
+                # Build the archive on its own so its offsets are relative to the zip, not the request body
+                with tempfile.TemporaryFile() as archive_file:
+                    with zipfile.ZipFile(archive_file, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+                        with archive.open(file_name, 'w') as entry:
+                            shutil.copyfileobj(file, entry)
+                    archive_file.seek(0)
+                    shutil.copyfileobj(archive_file, stream)
+            else:
+                shutil.copyfileobj(file, stream)
+
+        stream.write(f"\r\n--{boundary}--\r\n".encode())
+        if stream is not body:
+            stream.close()  # Writes the gzip trailer, body itself stays open
+
+        size = body.tell()
+        body.seek(0)
+        return body, f"multipart/form-data; boundary={boundary}", size
+
+    # Function to post the file to DUCO with the selected compression, returns the response and bytes sent
+    def post_file(file_path, compression):
+        if compression in ("gzip", "zip"):
+            body, content_type, size = build_compressed_upload(file_path, compression)
+            headers = {**DUCO_API_HEADERS, "Content-Type": content_type}
+            if compression == "gzip":
+                headers["Content-Encoding"] = "gzip"
+            with body:
+                return requests.post(DUCO_SUBMISSION_URL, headers=headers, data=body), size
+
+        with open(file_path, "rb") as file:
+            files = {"file": file}
+            return requests.post(DUCO_SUBMISSION_URL, headers=DUCO_API_HEADERS, files=files), os.path.getsize(file_path)
+
     def submit_file(file_path, status_container):
         try:
             status_container.update(label=f"Submitting {os.path.basename(file_path)} to DUCO...", state="running")
-            with open(file_path, "rb") as file:
-                files = {"file": file}
-                response = requests.post(DUCO_SUBMISSION_URL, headers=DUCO_API_HEADERS, files=files)
+            start_time = time.monotonic()
+            response, bytes_sent = post_file(file_path, compression)
+            transfer_info = (
+                f"**Transfer**: {bytes_sent} of {os.path.getsize(file_path)} bytes sent "
+                f"({compression}) in {time.monotonic() - start_time:.2f}s\n\n"
+            )
+            logging.info(f"Submitted {file_path}: {bytes_sent} bytes sent ({compression})")
 
             if response and response.status_code == 200:
                 response_data = response.json()
@@ -738,6 +1281,7 @@ def file_submission_to_duco():
                     f"**MD5 Sum**: {md5sum}\n\n"
                     f"**Size**: {size}\n\n"
                     f"**Runs Triggered**: {len(runs_triggered)}\n\n"
+                    f"{transfer_info}"
                 )
 
                 if runs_triggered:
@@ -794,6 +1338,153 @@ def file_submission_to_duco():
         process_file_submission('INSTRUMENTS', "GFOX", gfox_directory, FILE_PATTERNS['INSTRUMENTS']['GFOX'])
         process_file_submission('INSTRUMENTS', "LCH", lch_directory, FILE_PATTERNS['INSTRUMENTS']['LCH'])
 
+# -------------------------- Profiling --------------------------
+
+# tracemalloc and the profiler hooks are process-wide, but every Streamlit session runs
+# its script in its own thread, so only one run is profiled at a time. One lock per
+# Streamlit server process, shared by every session and rerun
+@st.cache_resource
+def get_profile_lock():
+    return threading.Lock()
+
+class StackSampler:
+    """Samples one thread's call stack at a fixed interval and counts the collapsed stacks.
+
+    With track_memory it also keeps a tracemalloc snapshot from close to the point of peak
+    memory, taken again each time traced memory grows by PROFILE_PEAK_SNAPSHOT_GROWTH.
+    """
+
+    def __init__(self, thread_id, interval=PROFILE_SAMPLE_INTERVAL, track_memory=False):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.track_memory = track_memory
+        self.counts = Counter()
+        self.peak_snapshot = None
+        self.peak_size = 0
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def start(self):
+        if self.track_memory:
+            self.peak_size = tracemalloc.get_traced_memory()[0]
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        self.thread.join()
+
+    def run(self):
+        while not self.stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if stack:
+                self.counts[";".join(reversed(stack))] += 1
+
+            if self.track_memory:
+                current, _ = tracemalloc.get_traced_memory()
+                if current > self.peak_size * PROFILE_PEAK_SNAPSHOT_GROWTH:
+                    self.peak_snapshot = tracemalloc.take_snapshot()
+                    self.peak_size = current
+
+    def write_collapsed(self, path):
+        with open(path, 'w', encoding='utf-8') as file:
+            for stack, count in self.counts.most_common():
+                file.write(f"{stack} {count}\n")
+
+# Function to list the functions with the most time spent in their own code
+def top_functions(profiler):
+    stats = pstats.Stats(profiler)
+    rows = []
+    for (filename, lineno, function), (_, calls, tottime, cumtime, _) in stats.stats.items():
+        rows.append({
+            "function": f"{function} ({os.path.basename(filename)}:{lineno})",
+            "calls": calls,
+            "own_s": round(tottime, 4),
+            "cumulative_s": round(cumtime, 4)
+        })
+    return pd.DataFrame(rows).sort_values("own_s", ascending=False).head(PROFILE_TOP_N)
+
+# Function to list the source lines whose allocations grew the most between two snapshots
+def top_allocations(snapshot, baseline):
+    filters = [
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>")
+    ]
+    differences = snapshot.filter_traces(filters).compare_to(baseline.filter_traces(filters), 'lineno')
+    return pd.DataFrame([
+        {
+            "location": f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+            "size_kib": round(stat.size_diff / 1024, 1),
+            "allocations": stat.count_diff
+        }
+        for stat in differences if stat.size_diff > 0
+    ][:PROFILE_TOP_N], columns=["location", "size_kib", "allocations"])
+
+# Function to save the profile files of a run and show the hot functions and allocation sites
+def save_profile(run_path, profiler, sampler, baseline, elapsed):
+    snapshot = sampler.peak_snapshot or tracemalloc.take_snapshot()
+    _, peak = tracemalloc.get_traced_memory()
+
+    profiler.dump_stats(f"{run_path}.prof")
+    sampler.write_collapsed(f"{run_path}.collapsed")
+    logging.info(f"Profile saved: {run_path}.prof, {run_path}.collapsed")
+
+    with st.expander("Profile of this run", expanded=True):
+        st.caption(
+            f"{elapsed:.2f}s wall time, {peak / 1024 / 1024:.1f} MiB peak traced memory, "
+            f"{sum(sampler.counts.values())} stack samples. Saved to {run_path}.prof and {run_path}.collapsed"
+        )
+        st.write("Hot functions")
+        st.dataframe(top_functions(profiler), hide_index=True)
+        st.write("Top allocation sites (growth from the start of the run to peak memory)")
+        st.dataframe(top_allocations(snapshot, baseline), hide_index=True)
+
+# Function to run one app under cProfile, a stack sampler and tracemalloc, then save and show the results
+def run_with_profiling(app):
+    profile_lock = get_profile_lock()
+    if not profile_lock.acquire(blocking=False):
+        st.sidebar.warning("Another session is being profiled, this run is not profiled.")
+        app()
+        return
+
+    try:
+        if tracemalloc.is_tracing():
+            st.sidebar.warning("tracemalloc is already in use in this process, this run is not profiled.")
+            app()
+            return
+
+        os.makedirs(PROFILE_DIRECTORY, exist_ok=True)
+        run_path = os.path.join(PROFILE_DIRECTORY, f"{app.__name__}_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}")
+
+        tracemalloc.start()
+        try:
+            baseline = tracemalloc.take_snapshot()
+            profiler = cProfile.Profile()
+            sampler = StackSampler(threading.get_ident(), track_memory=True)
+            start_time = time.monotonic()
+            profiler.enable()
+            sampler.start()
+            try:
+                app()
+            finally:
+                # Runs on st.rerun()/st.stop() too, so every profiled run leaves its files behind
+                profiler.disable()
+                sampler.stop()
+                # A failure while saving must not replace an exception raised by the app
+                try:
+                    save_profile(run_path, profiler, sampler, baseline, time.monotonic() - start_time)
+                except Exception as e:
+                    logging.error(f"Failed to save profile {run_path}: {str(e)}")
+        finally:
+            tracemalloc.stop()
+    finally:
+        profile_lock.release()
+
 # -------------------------- Main Application --------------------------
 
 def main():
@@ -803,12 +1494,20 @@ def main():
 
     app_choice = st.sidebar.radio("Choose a process to run:", ('GFOX EOD File Extraction', 'LCH EOD File Extraction', 'File Submission to DUCO'))
 
+    # Profiling adds overhead, so it is opt-in and covers each run while ticked
+    profile_run = st.sidebar.checkbox("Profile runs (cProfile + tracemalloc)")
+
     if app_choice == 'GFOX EOD File Extraction':
-        gfox_eod_file_extraction()
+        app = gfox_eod_file_extraction
     elif app_choice == 'LCH EOD File Extraction':
-        lch_eod_file_extraction()
+        app = lch_eod_file_extraction
     elif app_choice == 'File Submission to DUCO':
-        file_submission_to_duco()
+        app = file_submission_to_duco
+
+    if profile_run:
+        run_with_profiling(app)
+    else:
+        app()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,176 @@
+"""Local stand-in for the LCH outbound server and the DUCO submissions API.
+
+Used to measure the compressed transfer paths of gfox_lch_eod_app.py without
+touching production. Serves the files of --directory under /outbound/ (gzip
+encoded when the client accepts it) and accepts uploads on /api/submissions
+(plain, gzip Content-Encoding or zip wrapped). Every transfer prints the bytes
+on the wire, the decoded size and the wall time.
+
+Usage:
+    python tools/transfer_standin.py --directory "path/to/LCH files" --port 8765
+
+then point the app at it:
+    LCH_OUTBOUND_URL = "http://127.0.0.1:8765/outbound/"
+    DUCO_SUBMISSION_URL = "http://127.0.0.1:8765/api/submissions"
+"""
+import argparse
+import email
+import gzip
+import hashlib
+import html
+import io
+import json
+import os
+import shutil
+import tempfile
+import time
+import zipfile
+import zlib
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote
+
+CHUNK_SIZE = 64 * 1024
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    directory = "."
+    use_gzip = True
+
+    def do_GET(self):
+        if not self.path.startswith("/outbound/"):
+            self.send_error(404)
+            return
+
+        file_name = unquote(self.path[len("/outbound/"):])
+        if not file_name:
+            self.send_listing()
+            return
+
+        file_path = os.path.join(self.directory, os.path.basename(file_name))
+        if not os.path.isfile(file_path):
+            self.send_error(404)
+            return
+
+        start_time = time.monotonic()
+        compress = self.use_gzip and "gzip" in self.headers.get("Accept-Encoding", "")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/octet-stream")
+        if compress:
+            # Compress while streaming, the compressed size is not known up front
+            self.send_header("Content-Encoding", "gzip")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            sent = self.send_gzip_chunked(file_path)
+        else:
+            self.send_header("Content-Length", str(os.path.getsize(file_path)))
+            self.end_headers()
+            with open(file_path, "rb") as file:
+                shutil.copyfileobj(file, self.wfile, CHUNK_SIZE)
+            sent = os.path.getsize(file_path)
+
+        print(f"GET  {file_name}: {sent} bytes sent ({'gzip' if compress else 'identity'}) "
+              f"for {os.path.getsize(file_path)} bytes in {time.monotonic() - start_time:.2f}s")
+
+    def send_listing(self):
+        links = "".join(
+            f'<a href="{html.escape(name)}">{html.escape(name)}</a><br>'
+            for name in sorted(os.listdir(self.directory))
+            if os.path.isfile(os.path.join(self.directory, name))
+        )
+        body = f"<html><body>{links}</body></html>".encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_gzip_chunked(self, file_path):
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        sent = 0
+        with open(file_path, "rb") as file:
+            while True:
+                block = file.read(CHUNK_SIZE)
+                data = compressor.compress(block) if block else compressor.flush()
+                if data:
+                    self.wfile.write(f"{len(data):X}\r\n".encode() + data + b"\r\n")
+                    sent += len(data)
+                if not block:
+                    break
+        self.wfile.write(b"0\r\n\r\n")
+        return sent
+
+    def do_POST(self):
+        if not self.path.startswith("/api/submissions"):
+            self.send_error(404)
+            return
+
+        start_time = time.monotonic()
+        length = int(self.headers["Content-Length"])
+        with tempfile.TemporaryFile() as body:
+            remaining = length
+            while remaining:
+                block = self.rfile.read(min(CHUNK_SIZE, remaining))
+                if not block:
+                    break
+                body.write(block)
+                remaining -= len(block)
+            body.seek(0)
+            encoding = self.headers.get("Content-Encoding", "identity")
+            raw = gzip.GzipFile(fileobj=body).read() if encoding == "gzip" else body.read()
+        received_time = time.monotonic() - start_time
+
+        message = email.message_from_bytes(
+            f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode() + raw
+        )
+        part = message.get_payload()[0]
+        name = part.get_filename()
+        content = part.get_payload(decode=True)
+        upload_method = "gzip" if encoding == "gzip" else "plain"
+        if name.endswith(".zip"):
+            with zipfile.ZipFile(io.BytesIO(content)) as archive:
+                name = archive.namelist()[0]
+                content = archive.read(name)
+            upload_method = "zip"
+
+        md5sum = hashlib.md5(content).hexdigest()
+        print(f"POST {name}: {length} bytes received ({upload_method}) for {len(content)} bytes "
+              f"in {received_time:.2f}s, md5 {md5sum}")
+
+        response = json.dumps({
+            "id": int(time.time() * 1000),
+            "name": name,
+            "submission_time": datetime.now().isoformat(timespec="seconds"),
+            "upload_method": upload_method,
+            "md5sum": md5sum,
+            "size": len(content),
+            "runs_triggered": [],
+            "processes_awaiting_input": []
+        }).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(response)))
+        self.end_headers()
+        self.wfile.write(response)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--directory", default=".", help="Folder served under /outbound/")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--no-gzip", action="store_true", help="Serve downloads uncompressed")
+    args = parser.parse_args()
+
+    StandInHandler.directory = args.directory
+    StandInHandler.use_gzip = not args.no_gzip
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), StandInHandler)
+    print(f"Serving {os.path.abspath(args.directory)} on http://127.0.0.1:{args.port}/outbound/")
+    print(f"Accepting uploads on http://127.0.0.1:{args.port}/api/submissions")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()